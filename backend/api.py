@@ -2,13 +2,12 @@ import os
 import numpy as np
 import logging
 import io
-import base64
 from datetime import datetime
 import uuid
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Response, BackgroundTasks, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
 import tensorflow as tf
@@ -16,6 +15,14 @@ from tensorflow.keras.applications import EfficientNetB3
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import GlobalAveragePooling2D, Dense
 import uvicorn
+from heads import load_heads, get_pooled_features, create_multi_head_model, split_outputs
+from history import (
+    SupabaseHistoryStore, TTLCache, configure_history, invalidate_user_history, etag_matches,
+    router as history_router
+)
+from auth import require_user_id
+from derivatives import DerivativeCache, VARIANTS
+from profiling import router as profiling_router
 
 # Set up logging with more detailed format
 logging.basicConfig(
@@ -36,6 +43,11 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Admin-only profiling endpoints, enabled by setting PROFILING_ADMIN_TOKEN
+app.include_router(profiling_router)
+# Prediction history for the authenticated user
+app.include_router(history_router)
+
 # Import EfficientNet preprocessing
 from tensorflow.keras.applications.efficientnet import preprocess_input
 
@@ -54,6 +66,13 @@ FALLBACK_PATHS = [
 # Load environment variables from .env file
 load_dotenv()
 
+# Prediction history pages are served from a short-lived read-through cache
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "10"))
+
+# Multi-head mode attaches the extra heads from heads.py to the classifier
+# backbone so a single forward pass serves every head
+MULTI_HEAD_MODE = os.getenv("MULTI_HEAD_MODE", "false").lower() == "true"
+
 # Initialize Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -68,6 +87,12 @@ if supabase_url and supabase_key:
 else:
     logger.warning("Supabase configuration missing. Check your .env file for SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
 
+configure_history(
+    SupabaseHistoryStore(supabase) if supabase else None,
+    TTLCache(ttl=HISTORY_CACHE_TTL)
+)
+derivative_cache = DerivativeCache()
+
 def create_model():
     """Create and return the EfficientNetB3-based model architecture."""
     try:
@@ -146,12 +171,98 @@ def preprocess_image(image):
         logger.error(f"Error preprocessing image: {str(e)}")
         raise
 
+def load_serving_model(model):
+    """
+    Return the model used for predictions and the names of its extra heads.
+
+    Outside multi-head mode, or if no head can be loaded, this is the plain classifier.
+    """
+    if not MULTI_HEAD_MODE:
+        return model, []
+    try:
+        feature_dim = get_pooled_features(model).shape[-1]
+        heads = load_heads(feature_dim)
+        if not heads:
+            logger.warning("Multi-head mode enabled but no head weights found")
+            return model, []
+        logger.info(f"Multi-head mode enabled with heads: {list(heads)}")
+        return create_multi_head_model(model, heads), list(heads)
+    except Exception as e:
+        logger.error(f"Error loading extra heads, serving classifier only: {str(e)}")
+        return model, []
+
 # Load the model at startup
 try:
     model = load_model()
+    serving_model, head_names = load_serving_model(model)
 except Exception as e:
     logger.error(f"Failed to load model at startup: {str(e)}")
     model = None
+    serving_model, head_names = None, []
+
+def run_prediction(content: bytes) -> Dict[str, Any]:
+    """Run the model on an uploaded image and format the results for the frontend."""
+    image = Image.open(io.BytesIO(content)).convert('RGB')
+    
+    # Preprocess image
+    processed_image = preprocess_image(image)
+    logger.info("Image preprocessed successfully")
+    # Make prediction with no verbosity; in multi-head mode this also
+    # computes every extra head from the same backbone pass
+    outputs = serving_model.predict(processed_image, verbose=0)
+    predictions, head_outputs = split_outputs(outputs)
+    logger.info("Model prediction completed")
+    
+    # Get raw probabilities and apply temperature scaling to smooth predictions
+    temperature = 1.5  # Adjust this value to control prediction smoothness
+    raw_probs = predictions[0]
+    scaled_probs = np.exp(np.log(raw_probs) / temperature)
+    scaled_probs = scaled_probs / np.sum(scaled_probs)  # Renormalize
+    
+    # Get class probabilities using the scaled predictions
+    class_probabilities = {
+        class_name: float(prob)
+        for class_name, prob in zip(CLASSES, scaled_probs)
+    }
+    
+    # Get predicted class and confidence from scaled probabilities
+    predicted_class = CLASSES[np.argmax(scaled_probs)]
+    confidence = float(np.max(scaled_probs))
+    
+    # Log raw predictions for debugging
+    logger.info("Raw predictions: %s", 
+               {class_name: f"{prob:.4f}" 
+                for class_name, prob in zip(CLASSES, raw_probs)})
+    
+    # Log detailed prediction values
+    for class_name, prob in class_probabilities.items():
+        logger.info(f"Prediction for {class_name}: {prob:.6f}")
+    # Format results in the format expected by the frontend
+    results = {
+        "predictions": class_probabilities,
+        "top_prediction": predicted_class,
+        "confidence": confidence,
+        "heads": head_outputs,
+        "prediction_id": None,  # Will be filled by Supabase
+        "saved_at": None  # Will be filled by Supabase
+    }
+    return results
+
+def prepare_storage(results: Dict[str, Any], content: bytes, user_id: str) -> bool:
+    """
+    Register the upload by content hash and save the prediction row.
+
+    The row is inserted without its image so the response carries the ID of
+    a row that exists; the preview is encoded and attached afterwards by
+    store_preview(). Returns whether store_preview() should be scheduled,
+    i.e. whether the row was saved.
+    """
+    results["image_id"] = derivative_cache.add(content, owner=user_id)
+
+    if not supabase:
+        return False
+    save_prediction_to_supabase(prediction_data=results, user_id=user_id)
+    return results.get("prediction_id") is not None
 
 @app.get("/")
 async def read_root():
@@ -160,7 +271,8 @@ async def read_root():
         "message": "OphthalmoScan AI API is running",
         "status": "healthy",
         "modelLoaded": model is not None,
-        "modelType": "EfficientNetB3"
+        "modelType": "EfficientNetB3",
+        "heads": head_names
     }
 
 @app.get("/api/health")
@@ -174,8 +286,9 @@ async def health_check():
 
 @app.post("/predict/")
 async def predict(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    user_id: str
+    user_id: str = Form(...)
 ):
     """
     Handle image prediction requests and save results to Supabase.
@@ -211,65 +324,14 @@ async def predict(
 
         # Read file content
         content = await file.read()
-        image = Image.open(io.BytesIO(content)).convert('RGB')
-        
-        # Preprocess image
-        processed_image = preprocess_image(image)
-        logger.info("Image preprocessed successfully")
-          # Make prediction with no verbosity
-        predictions = model.predict(processed_image, verbose=0)
-        logger.info("Model prediction completed")
-        
-        # Get raw probabilities and apply temperature scaling to smooth predictions
-        temperature = 1.5  # Adjust this value to control prediction smoothness
-        raw_probs = predictions[0]
-        scaled_probs = np.exp(np.log(raw_probs) / temperature)
-        scaled_probs = scaled_probs / np.sum(scaled_probs)  # Renormalize
-        
-        # Get class probabilities using the scaled predictions
-        class_probabilities = {
-            class_name: float(prob)
-            for class_name, prob in zip(CLASSES, scaled_probs)
-        }
-        
-        # Get predicted class and confidence from scaled probabilities
-        predicted_class = CLASSES[np.argmax(scaled_probs)]
-        confidence = float(np.max(scaled_probs))
-        
-        # Log raw predictions for debugging
-        logger.info("Raw predictions: %s", 
-                   {class_name: f"{prob:.4f}" 
-                    for class_name, prob in zip(CLASSES, raw_probs)})
-        
-        # Log detailed prediction values
-        for class_name, prob in class_probabilities.items():
-            logger.info(f"Prediction for {class_name}: {prob:.6f}")
-          # Format results in the format expected by the frontend
-        results = {
-            "predictions": class_probabilities,
-            "top_prediction": predicted_class,
-            "confidence": confidence,
-            "prediction_id": None,  # Will be filled by Supabase
-            "saved_at": None  # Will be filled by Supabase
-        }
-        
-        # Convert image to base64 for storage
-        try:
-            buffered = io.BytesIO()
-            image.save(buffered, format="JPEG")
-            image_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            # Save to Supabase and get updated results
-            results = save_prediction_to_supabase(
-                prediction_data=results,
-                image_base64=image_base64,
-                user_id=user_id
-            )
-        except Exception as e:
-            logger.error(f"Error preparing image for storage: {str(e)}")
-            # Continue without storage - predictions are still valid
+        results = run_prediction(content)
+
+        # Attach the image preview after the response is sent so the upload
+        # doesn't wait on image encoding
+        if prepare_storage(results, content, user_id):
+            background_tasks.add_task(store_preview, results["prediction_id"], content, results["image_id"])
         
-        logger.info(f"Prediction successful. Predicted class: {predicted_class}")
+        logger.info(f"Prediction successful. Predicted class: {results['top_prediction']}")
         return results
 
     except Exception as e:
@@ -278,9 +340,54 @@ async def predict(
         raise HTTPException(status_code=500, detail=f"Failed to analyze image: {error_msg}")
 
 @app.post("/api/predict")
-async def legacy_predict(file: UploadFile = File(...)):
+async def legacy_predict(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    user_id: str = Form(...)
+):
     """Legacy endpoint compatible with the previous API path."""
-    return await predict(file)
+    return await predict(background_tasks, file, user_id)
+
+@app.get("/api/images/{image_id}/{variant}")
+def image_derivative(
+    image_id: str,
+    variant: str,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(require_user_id)
+):
+    """
+    Return a derivative (original, preview or thumbnail) of one of the caller's uploads.
+
+    Derivatives are built on first access and cached by content hash, so they
+    are only available while the upload is still in the cache.
+    """
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=404, detail=f"Unknown image variant: {variant}")
+
+    # The content hash is not a secret, so only the uploader may fetch the image
+    derivatives = derivative_cache.get(image_id, owner=user_id)
+    if derivatives is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {"ETag": f'"{image_id}-{variant}"', "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    derivative = derivatives[variant]
+    return Response(content=derivative.content, media_type=derivative.media_type, headers=headers)
+
+def store_preview(prediction_id: str, content: bytes, image_id: Optional[str] = None):
+    """Build the image preview and attach it to a saved prediction. Runs as a background task."""
+    try:
+        # Store the 1024 px JPEG preview rather than the full-resolution upload,
+        # to keep prediction rows small; this also fills the derivative cache
+        preview = derivative_cache.get_or_build(content, image_id)["preview"]
+        supabase.table("predictions").update(
+            {"image_url": preview.to_data_url()}
+        ).eq("id", prediction_id).execute()
+        logger.info(f"📸 Image preview attached to prediction {prediction_id}")
+    except Exception as e:
+        logger.error(f"Error storing image for prediction {prediction_id}: {str(e)}")
 
 def save_prediction_to_supabase(
     prediction_data: Dict[str, Any],
@@ -289,15 +396,17 @@ def save_prediction_to_supabase(
 ) -> Dict[str, Any]:
     """
     Save prediction results to Supabase and return updated prediction data.
+
+    A prediction_id and saved_at already present in prediction_data are kept.
     """
     if not supabase:
         logger.error("❌ Supabase client not configured")
         return prediction_data
     
     try:
-        # Generate unique ID and timestamp
-        prediction_id = str(uuid.uuid4())
-        saved_at = datetime.utcnow().isoformat()
+        # Generate unique ID and timestamp unless assigned by the caller
+        prediction_id = prediction_data.get("prediction_id") or str(uuid.uuid4())
+        saved_at = prediction_data.get("saved_at") or datetime.utcnow().isoformat()
         
         logger.info(f"🔄 Preparing to save prediction {prediction_id} to Supabase")
         logger.info(f"👤 User ID: {user_id}")
@@ -339,6 +448,7 @@ def save_prediction_to_supabase(
                 raise Exception("No data returned from Supabase")
             
             logger.info(f"✅ Successfully saved prediction {prediction_id} to Supabase")
+            invalidate_user_history(user_id)
             
             # Update prediction data with storage info
             prediction_data["prediction_id"] = prediction_id
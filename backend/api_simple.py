@@ -16,7 +16,6 @@ ssl.create_default_context = custom_create_default_context
 import numpy as np
 import logging
 import io
-import base64
 import json
 from datetime import datetime
 import uuid
@@ -24,7 +23,7 @@ from typing import Optional, Dict, Any
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
 import tensorflow as tf
@@ -33,6 +32,7 @@ from tensorflow.keras.models import Model
 from tensorflow.keras.layers import GlobalAveragePooling2D, Dense
 from tensorflow.keras.applications.efficientnet import preprocess_input
 import uvicorn
+from derivatives import build_derivatives
 
 # Set up logging
 logging.basicConfig(
@@ -106,7 +106,11 @@ def save_prediction_to_supabase(
     image_base64: Optional[str] = None,
     user_id: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Save prediction to Supabase using direct REST API calls."""
+    """
+    Save prediction to Supabase using direct REST API calls.
+
+    A prediction_id and saved_at already present in prediction_data are kept.
+    """
     if not supabase_url or not supabase_key:
         logger.warning("⚠️ Supabase configuration missing, skipping storage")
         return prediction_data
@@ -115,8 +119,8 @@ def save_prediction_to_supabase(
         raise HTTPException(status_code=401, detail="User ID is required")
     
     try:
-        prediction_id = str(uuid.uuid4())
-        saved_at = datetime.utcnow().isoformat()
+        prediction_id = prediction_data.get("prediction_id") or str(uuid.uuid4())
+        saved_at = prediction_data.get("saved_at") or datetime.utcnow().isoformat()
         
         supabase_data = {
             "id": str(prediction_id),
@@ -165,8 +169,35 @@ except Exception as e:
     logger.error(f"Failed to load model at startup: {str(e)}")
     model = None
 
+def store_preview(prediction_id: str, content: bytes, filename: str):
+    """Build the image preview and attach it to a saved prediction. Runs as a background task."""
+    try:
+        # The preview is the previous 1024 px max re-encode, now built with draft-mode decoding
+        preview = build_derivatives(content)["preview"]
+        logger.info(f"Processed image {filename}: {len(content)} bytes -> {len(preview.content)} bytes preview")
+        response = requests.patch(
+            f"{supabase_url}/rest/v1/predictions",
+            params={"id": f"eq.{prediction_id}"},
+            headers={
+                "apikey": supabase_key,
+                "Authorization": f"Bearer {supabase_key}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal"
+            },
+            data=json.dumps({"image_url": preview.to_data_url()}),
+            verify=certifi.where()
+        )
+        response.raise_for_status()
+        logger.info(f"Image preview attached to prediction {prediction_id}")
+    except Exception as e:
+        logger.error(f"Error storing image for prediction {prediction_id}: {str(e)}")
+
 @app.post("/predict/")
-async def predict(file: UploadFile = File(...), user_id: str = Form(...)):
+async def predict(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    user_id: str = Form(...)
+):
     """Handle image prediction requests."""
     try:
         if model is None:
@@ -207,64 +238,12 @@ async def predict(file: UploadFile = File(...), user_id: str = Form(...)):
             "saved_at": None
         }
         
-        # Save to Supabase if possible
-        try:
-            # Validate and process image before converting to base64
-            try:
-                # Create a new BytesIO buffer for each request
-                with io.BytesIO(content) as input_buffer:
-                    # Open image and convert to RGB if needed
-                    img = Image.open(input_buffer)
-                    
-                    # Log original image details for debugging
-                    logger.info(f"Processing new image: {file.filename}")
-                    logger.info(f"Original image size: {img.size}, mode: {img.mode}, format: {img.format}")
-                    
-                    # Convert to RGB if necessary
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Resize if needed
-                    max_size = 1024
-                    if max(img.size) > max_size:
-                        ratio = max_size / max(img.size)
-                        new_size = tuple(int(dim * ratio) for dim in img.size)
-                        img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    
-                    # Create a new buffer for the processed image
-                    with io.BytesIO() as output_buffer:
-                        # Save as JPEG with controlled quality
-                        img.save(output_buffer, format='JPEG', quality=85, optimize=True)
-                        # Get the binary data
-                        image_binary = output_buffer.getvalue()
-                        # Convert to base64
-                        image_base64 = base64.b64encode(image_binary).decode()
-                        
-                        # Log verification data
-                        logger.info(f"Processed image size: {len(image_binary)} bytes")
-                        logger.info(f"Base64 string length: {len(image_base64)} chars")
-                        logger.info(f"First 50 chars of base64: {image_base64[:50]}")
-                
-                if not image_base64:
-                    raise ValueError("Base64 conversion failed - empty string")
-                
-            except Exception as img_error:
-                logger.error(f"Error processing image {file.filename}: {str(img_error)}")
-                raise HTTPException(status_code=400, detail=f"Image processing failed: {str(img_error)}")
-            
-            # Save to Supabase
-            results = save_prediction_to_supabase(
-                prediction_data=results,
-                image_base64=image_base64,
-                user_id=user_id
-            )
-            logger.info(f"Prediction saved for user {user_id} with image of size {len(image_base64)} chars")
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            error_msg = f"Error saving prediction: {str(e)}"
-            logger.error(error_msg)
-            raise HTTPException(status_code=500, detail=error_msg)
+        # Save the row now so a failed insert is reported to the client, and
+        # attach the image preview after the response is sent so the upload
+        # doesn't wait on image encoding
+        if supabase_url and supabase_key:
+            results = save_prediction_to_supabase(prediction_data=results, user_id=user_id)
+            background_tasks.add_task(store_preview, results["prediction_id"], content, file.filename)
         
         return results
         
@@ -0,0 +1,80 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from typing import Optional, Dict, Any
+
+from fastapi import Header, HTTPException
+
+# Clock skew tolerated when checking exp/nbf, in seconds
+LEEWAY = 30
+
+class InvalidTokenError(Exception):
+    pass
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def verify_jwt(token: str, secret: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Verify an HS256 JWT and return its claims.
+
+    Only HS256 is accepted, so a token cannot downgrade to `none` or switch
+    to an algorithm verified with a different key.
+    """
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = json.loads(_b64url_decode(header_segment))
+        claims = json.loads(_b64url_decode(payload_segment))
+        signature = _b64url_decode(signature_segment)
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise ValueError("Token header and claims must be JSON objects")
+    except (ValueError, TypeError) as e:
+        raise InvalidTokenError("Malformed token") from e
+
+    if header.get("alg") != "HS256":
+        raise InvalidTokenError("Unsupported token algorithm")
+
+    signing_input = f"{header_segment}.{payload_segment}".encode()
+    expected = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidTokenError("Invalid token signature")
+
+    now = time.time() if now is None else now
+    try:
+        if "exp" in claims and now > float(claims["exp"]) + LEEWAY:
+            raise InvalidTokenError("Token expired")
+        if "nbf" in claims and now < float(claims["nbf"]) - LEEWAY:
+            raise InvalidTokenError("Token not yet valid")
+    except (ValueError, TypeError) as e:
+        raise InvalidTokenError("Malformed token claims") from e
+    return claims
+
+def require_user_id(authorization: Optional[str] = Header(None)) -> str:
+    """
+    FastAPI dependency returning the user ID of the authenticated caller.
+
+    Expects the session token from Clerk's `supabase` JWT template (see
+    lib/auth/supabase-clerk.ts), which is signed with the Supabase JWT secret
+    and carries the Clerk user ID in `sub`.
+    """
+    # Read at request time so values loaded from .env are picked up
+    secret = os.getenv("SUPABASE_JWT_SECRET")
+    if not secret:
+        raise HTTPException(status_code=503, detail="Authentication is not configured")
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = verify_jwt(token.strip(), secret)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+    user_id = claims.get("sub")
+    if not user_id or str(user_id).lower() == 'anonymous':
+        raise HTTPException(status_code=401, detail="A valid user ID is required")
+    return str(user_id)
@@ -0,0 +1,70 @@
+"""
+Benchmark the marginal cost of extra heads in multi-head mode.
+
+Builds the classifier architecture from api.py with random weights (so no
+weight files or network access are needed), then times model.predict with
+0, 1, ... N extra heads attached to the shared backbone.
+
+Usage: python benchmark_heads.py [--batch-size 8] [--runs 20]
+"""
+import time
+import argparse
+import numpy as np
+from tensorflow.keras.applications import EfficientNetB3
+from tensorflow.keras.layers import GlobalAveragePooling2D, Dense
+from tensorflow.keras.models import Model
+
+from heads import HEADS, create_head, get_pooled_features, create_multi_head_model
+
+IMG_SIZE = 224
+NUM_CLASSES = 4
+
+def create_classifier():
+    """Same architecture as create_model() in api.py, without pretrained weights."""
+    base_model = EfficientNetB3(weights=None, include_top=False, input_shape=(IMG_SIZE, IMG_SIZE, 3))
+    x = GlobalAveragePooling2D()(base_model.output)
+    x = Dense(256, activation='relu')(x)
+    predictions = Dense(NUM_CLASSES, activation='softmax')(x)
+    return Model(inputs=base_model.input, outputs=predictions)
+
+def time_predict(model, batch, runs):
+    """Return the median model.predict latency in milliseconds."""
+    # Warm-up call so graph tracing is not included in the timings
+    model.predict(batch, verbose=0)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(batch, verbose=0)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extra heads on the shared backbone")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--extra-heads', type=int, default=len(HEADS),
+                        help="Number of extra heads to attach (configured heads are reused cyclically)")
+    args = parser.parse_args()
+
+    classifier = create_classifier()
+    feature_dim = get_pooled_features(classifier).shape[-1]
+    batch = np.random.random((args.batch_size, IMG_SIZE, IMG_SIZE, 3)).astype('float32') * 255.0
+
+    head_names = list(HEADS)
+    baseline = time_predict(classifier, batch, args.runs)
+    print(f"Classifier only: {baseline:.1f} ms per batch of {args.batch_size}")
+
+    heads = {}
+    previous = baseline
+    for i in range(args.extra_heads):
+        name = head_names[i % len(head_names)]
+        key = name if name not in heads else f"{name}_{i}"
+        heads[key] = create_head(key, HEADS[name], feature_dim)
+        model = create_multi_head_model(classifier, heads)
+        latency = time_predict(model, batch, args.runs)
+        print(f"+{len(heads)} head(s): {latency:.1f} ms "
+              f"(marginal {latency - previous:+.1f} ms, total overhead {latency - baseline:+.1f} ms)")
+        previous = latency
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import io
+import os
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Set, Union
+
+from PIL import Image
+
+# Longest side in pixels of each resized derivative
+DERIVATIVE_SIZES = {
+    "preview": 1024,
+    "thumbnail": 256,
+}
+VARIANTS = ("original",) + tuple(DERIVATIVE_SIZES)
+JPEG_QUALITY = 85
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+class Derivative(NamedTuple):
+    content: bytes
+    media_type: str
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.content).decode()
+
+    def to_data_url(self) -> str:
+        return f"data:{self.media_type};base64,{self.to_base64()}"
+
+def content_hash(content: bytes) -> str:
+    """Return the SHA-256 hex digest used as the cache key of an upload."""
+    return hashlib.sha256(content).hexdigest()
+
+def encode_jpeg(image: Image.Image) -> bytes:
+    """Encode an RGB image as JPEG."""
+    # optimize=True costs an extra Huffman pass for a few percent smaller files
+    with io.BytesIO() as buffer:
+        image.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+        return buffer.getvalue()
+
+def build_derivatives(content: bytes) -> Dict[str, Derivative]:
+    """
+    Create the archival original, preview and thumbnail of an upload in one decode pass.
+
+    The original bytes are kept as uploaded. For JPEG uploads, draft mode lets
+    the decoder downscale by 1/2, 1/4 or 1/8 while decoding, so large scans are
+    never fully decoded just to produce the preview.
+    """
+    with Image.open(io.BytesIO(content)) as img:
+        source_format = img.format or 'JPEG'
+        largest = max(DERIVATIVE_SIZES.values())
+        if source_format == 'JPEG':
+            img.draft('RGB', (largest, largest))
+        image = img.convert('RGB')
+
+    derivatives = {
+        "original": Derivative(content, Image.MIME.get(source_format, 'application/octet-stream'))
+    }
+
+    # Resize from largest to smallest so each step starts from the previous result
+    for name, size in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        derivatives[name] = Derivative(encode_jpeg(image), 'image/jpeg')
+
+    return derivatives
+
+class DerivativeCache:
+    """
+    Thread-safe LRU cache of image derivatives keyed by content hash.
+
+    Uploads can be added as raw bytes; their derivatives are only built on
+    first access. Each entry records the users who uploaded it, and lookups
+    with an `owner` only return entries that user uploaded. Entries are
+    evicted once the cache holds more than `max_bytes` of data, by default
+    DERIVATIVE_CACHE_MAX_BYTES from the environment.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_bytes = int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", str(DEFAULT_CACHE_MAX_BYTES)))
+        self.max_bytes = max_bytes
+        # Each entry is either the raw upload (not yet processed) or its derivatives
+        self._entries: "OrderedDict[str, Union[bytes, Dict[str, Derivative]]]" = OrderedDict()
+        self._owners: Dict[str, Set[str]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(entry) -> int:
+        if isinstance(entry, bytes):
+            return len(entry)
+        return sum(len(d.content) for d in entry.values())
+
+    def _store(self, digest: str, entry):
+        """Insert or replace an entry and evict the least recently used ones. Caller holds the lock."""
+        previous = self._entries.pop(digest, None)
+        if previous is not None:
+            self._size -= self._entry_size(previous)
+        self._entries[digest] = entry
+        self._size += self._entry_size(entry)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            evicted_digest, evicted = self._entries.popitem(last=False)
+            self._size -= self._entry_size(evicted)
+            self._owners.pop(evicted_digest, None)
+
+    def add(self, content: bytes, digest: Optional[str] = None, owner: Optional[str] = None) -> str:
+        """Register an upload by `owner` without processing it and return its content hash."""
+        digest = digest or content_hash(content)
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+            else:
+                self._store(digest, content)
+            if owner is not None and digest in self._entries:
+                self._owners.setdefault(digest, set()).add(owner)
+        return digest
+
+    def get(self, digest: str, owner: Optional[str] = None) -> Optional[Dict[str, Derivative]]:
+        """
+        Return the derivatives for a content hash, building them if needed.
+
+        With an `owner`, returns None unless that user uploaded the image.
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if owner is not None and owner not in self._owners.get(digest, ()):
+                return None
+            self._entries.move_to_end(digest)
+        if not isinstance(entry, bytes):
+            return entry
+
+        # Encoding happens outside the lock so concurrent uploads don't serialise
+        derivatives = build_derivatives(entry)
+        with self._lock:
+            if self._entries.get(digest) is entry:
+                self._store(digest, derivatives)
+        return derivatives
+
+    def get_or_build(self, content: bytes, digest: Optional[str] = None) -> Dict[str, Derivative]:
+        """Return the derivatives of `content`, building and caching them on a miss."""
+        # Fall back to an uncached build if the entry was evicted in between
+        return self.get(self.add(content, digest)) or build_derivatives(content)
@@ -0,0 +1,344 @@
+"""
+Lightweight control plane for the OphthalmoScan AI API.
+
+Serves health and readiness, validates and queues uploads, and forwards
+predictions to one or more inference workers (worker.py) over local IPC
+(see ipc.py). The other api.py routes (history, image derivatives,
+profiling) are forwarded to a worker unchanged. It never imports
+TensorFlow, PIL or Supabase, so it starts in well under a second and its
+readiness reflects the actual warm-up state of the workers.
+
+Usage (INFERENCE_AUTHKEY and the other settings can also be set in .env):
+    export INFERENCE_AUTHKEY=<shared secret>
+    python worker.py --socket /tmp/ophthalmoscan-worker-0.sock
+    INFERENCE_WORKERS=/tmp/ophthalmoscan-worker-0.sock python gateway.py
+"""
+import os
+import sys
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Tuple
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import uvicorn
+from dotenv import load_dotenv
+
+from ipc import get_authkey, default_address, connect, send_message, recv_message
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+WORKER_ADDRESSES = os.getenv("INFERENCE_WORKERS", default_address())
+MAX_QUEUE_SIZE = int(os.getenv("GATEWAY_MAX_QUEUE", "32"))
+MAX_UPLOAD_BYTES = int(os.getenv("GATEWAY_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+REQUEST_TIMEOUT = float(os.getenv("GATEWAY_REQUEST_TIMEOUT", "60"))
+STATUS_INTERVAL = 2.0
+# How many image_id -> worker mappings to remember for /api/images routing
+MAX_IMAGE_ROUTES = 10000
+# Idle connections kept open per worker; more are opened while calls overlap
+MAX_IDLE_CONNECTIONS = 4
+
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# File signatures of the accepted formats, checked without decoding the image
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n')
+# Response headers recomputed by the gateway's own Response
+HOP_BY_HOP_HEADERS = {"content-length", "transfer-encoding", "connection"}
+
+class WorkerConnection:
+    """
+    Pooled, blocking connections to one inference worker.
+
+    Each call uses its own connection (the worker serves every connection in
+    its own thread), so status polls and forwarded requests never wait
+    behind a running prediction.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self.name = address
+        self.authkey: Optional[bytes] = None
+        self.status: Dict[str, Any] = {"state": "unreachable", "ready": False}
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.status.get("ready"))
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.address, self.authkey)
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def call(self, header: Dict[str, Any], payload: bytes = b"",
+             timeout: float = REQUEST_TIMEOUT) -> Tuple[Dict[str, Any], bytes]:
+        """Send a request and wait for the reply. A connection that fails is discarded."""
+        conn = self._acquire()
+        try:
+            send_message(conn, header, payload)
+            if not conn.poll(timeout):
+                raise TimeoutError(f"Worker {self.name} did not reply within {timeout}s")
+            reply = recv_message(conn)
+        except Exception:
+            _close_quietly(conn)
+            raise
+        self._release(conn)
+        return reply
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            _close_quietly(conn)
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except OSError:
+        pass
+
+workers: List[WorkerConnection] = [
+    WorkerConnection(address.strip()) for address in WORKER_ADDRESSES.split(",") if address.strip()
+]
+# Pending predictions as (header, content, future); each ready worker pulls the next one
+request_queue: Optional[asyncio.Queue] = None
+# Image derivatives live in the cache of the worker that handled the upload
+image_routes: "OrderedDict[str, WorkerConnection]" = OrderedDict()
+
+async def call_worker(worker: WorkerConnection, header: Dict[str, Any],
+                      payload: bytes = b"") -> Tuple[Dict[str, Any], bytes]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, worker.call, header, payload)
+
+async def poll_worker_status(worker: WorkerConnection):
+    """Keep the worker's readiness up to date."""
+    while True:
+        try:
+            worker.status, _ = await call_worker(worker, {"op": "status"})
+        except Exception as e:
+            if worker.status.get("state") != "unreachable":
+                logger.warning(f"Worker {worker.name} unreachable: {str(e)}")
+            worker.status = {"state": "unreachable", "ready": False}
+        await asyncio.sleep(STATUS_INTERVAL)
+
+async def dispatch_to_worker(worker: WorkerConnection):
+    """Forward queued predictions to the worker, one at a time, while it is ready."""
+    while True:
+        if not worker.ready:
+            await asyncio.sleep(STATUS_INTERVAL / 4)
+            continue
+        header, content, future = await request_queue.get()
+        if future.cancelled():
+            continue
+        try:
+            reply, _ = await call_worker(worker, header, content)
+            image_id = (reply.get("body") or {}).get("image_id")
+            if image_id:
+                image_routes[image_id] = worker
+                while len(image_routes) > MAX_IMAGE_ROUTES:
+                    image_routes.popitem(last=False)
+            if not future.done():
+                future.set_result(reply)
+        except Exception as e:
+            logger.error(f"Error forwarding to worker {worker.name}: {str(e)}")
+            worker.status = {"state": "unreachable", "ready": False}
+            if not future.done():
+                future.set_result({"status": 502, "detail": "Inference worker failed"})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global request_queue
+    # Refuse to start without a shared secret for the worker connections
+    authkey = get_authkey()
+    for worker in workers:
+        worker.authkey = authkey
+
+    request_queue = asyncio.Queue(maxsize=MAX_QUEUE_SIZE)
+    tasks = []
+    for worker in workers:
+        tasks.append(asyncio.create_task(poll_worker_status(worker)))
+        tasks.append(asyncio.create_task(dispatch_to_worker(worker)))
+    logger.info(f"Gateway forwarding to workers: {[w.name for w in workers]}")
+    yield
+    for task in tasks:
+        task.cancel()
+    for worker in workers:
+        worker.close()
+
+app = FastAPI(
+    title="OphthalmoScan AI Gateway",
+    description="Health checks and request routing for the inference workers",
+    lifespan=lifespan
+)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def model_loaded() -> bool:
+    return any(worker.ready for worker in workers)
+
+def first_ready_worker() -> WorkerConnection:
+    for worker in workers:
+        if worker.ready:
+            return worker
+    raise HTTPException(status_code=503, detail="Model not loaded")
+
+async def forward_request(request: Request, worker: WorkerConnection) -> Response:
+    """Forward an HTTP request unchanged to a worker's api.py app."""
+    body = await request.body()
+    header = {
+        "op": "http",
+        "method": request.method,
+        "path": request.url.path,
+        "query": request.url.query,
+        "headers": [[name, value] for name, value in request.headers.items()],
+    }
+    try:
+        reply, content = await call_worker(worker, header, body)
+    except Exception as e:
+        logger.error(f"Error forwarding {request.url.path} to worker {worker.name}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Inference worker failed")
+
+    if "headers" not in reply:
+        raise HTTPException(status_code=reply.get("status", 502), detail=reply.get("detail"))
+    response = Response(content=content, status_code=reply["status"])
+    for name, value in reply["headers"]:
+        if name.lower() not in HOP_BY_HOP_HEADERS:
+            response.headers.append(name, value)
+    return response
+
+@app.get("/")
+async def read_root():
+    """Root endpoint returning status information, compatible with api.py."""
+    return {
+        "message": "OphthalmoScan AI API is running",
+        "status": "healthy",
+        "modelLoaded": model_loaded(),
+        "modelType": "EfficientNetB3"
+    }
+
+@app.get("/api/health")
+async def health_check():
+    """Liveness check; the gateway is healthy even while workers warm up."""
+    return {
+        "status": "healthy",
+        "modelLoaded": model_loaded(),
+        "modelType": "EfficientNetB3"
+    }
+
+@app.get("/api/ready")
+async def readiness_check():
+    """Readiness check; returns 503 until at least one worker has finished warming up."""
+    ready = model_loaded()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "queued": request_queue.qsize() if request_queue else 0,
+            "workers": {worker.name: worker.status for worker in workers},
+        }
+    )
+
+@app.post("/predict/")
+async def predict(
+    file: UploadFile = File(...),
+    user_id: str = Form(...)
+):
+    """Validate an upload and forward it to the next available inference worker."""
+    if not user_id or user_id.lower() == 'anonymous':
+        raise HTTPException(status_code=401, detail="A valid user ID is required")
+
+    if not file.filename or not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
+    content = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(content) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    if not content.startswith(IMAGE_SIGNATURES):
+        raise HTTPException(status_code=400, detail="File is not a PNG or JPEG image")
+
+    if not model_loaded():
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    future = asyncio.get_running_loop().create_future()
+    header = {"op": "predict", "filename": file.filename, "user_id": user_id}
+    try:
+        request_queue.put_nowait((header, content, future))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
+    try:
+        reply = await asyncio.wait_for(asyncio.shield(future), timeout=REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise HTTPException(status_code=504, detail="Prediction timed out")
+
+    if reply.get("status") != 200:
+        raise HTTPException(status_code=reply.get("status", 500), detail=reply.get("detail"))
+    return reply["body"]
+
+@app.post("/api/predict")
+async def legacy_predict(
+    file: UploadFile = File(...),
+    user_id: str = Form(...)
+):
+    """Legacy endpoint compatible with the previous API path."""
+    return await predict(file, user_id)
+
+@app.get("/api/images/{image_id}/{variant}")
+async def image_derivative(image_id: str, variant: str, request: Request):
+    """Forward to the worker whose cache holds the upload's derivatives."""
+    worker = image_routes.get(image_id)
+    if worker is None or not worker.ready:
+        worker = first_ready_worker()
+    return await forward_request(request, worker)
+
+@app.get("/api/history")
+@app.get("/api/history/{prediction_id}/image")
+async def prediction_history(request: Request):
+    """Forward history reads to any ready worker."""
+    return await forward_request(request, first_ready_worker())
+
+@app.api_route("/admin/profiling/{path:path}", methods=["GET", "POST"])
+async def profiling(request: Request):
+    """
+    Forward profiling requests to one worker, chosen with the
+    X-Inference-Worker header (its index in INFERENCE_WORKERS, default 0).
+    """
+    try:
+        worker = workers[int(request.headers.get("x-inference-worker", "0"))]
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Unknown inference worker")
+    return await forward_request(request, worker)
+
+if __name__ == "__main__":
+    try:
+        get_authkey()
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    logger.info("Starting OphthalmoScan AI gateway...")
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
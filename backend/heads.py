@@ -0,0 +1,97 @@
+import os
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+from tensorflow.keras.layers import Input, Dense, GlobalAveragePooling2D
+from tensorflow.keras.models import Model
+
+logger = logging.getLogger(__name__)
+
+# Lightweight task heads that share the classifier's EfficientNetB3 backbone.
+# Each head consumes the pooled backbone features and has its own weights file.
+HEADS: Dict[str, List[str]] = {
+    "image_quality": ['gradable', 'ungradable'],
+    "laterality": ['left', 'right'],
+}
+HEADS_DIR = os.path.join(os.path.dirname(__file__), '..', 'public', 'model', 'heads')
+HEAD_UNITS = 64
+
+def create_head(name: str, classes: List[str], feature_dim: int) -> Model:
+    """Create a small classification head on top of pooled backbone features."""
+    inputs = Input(shape=(feature_dim,), name=f"{name}_features")
+    x = Dense(HEAD_UNITS, activation='relu')(inputs)
+    outputs = Dense(len(classes), activation='softmax')(x)
+    return Model(inputs=inputs, outputs=outputs, name=f"{name}_head")
+
+def get_pooled_features(model: Model):
+    """Return the pooled backbone feature tensor of the classifier model."""
+    # EfficientNet's squeeze-and-excitation blocks also use GlobalAveragePooling2D,
+    # so search from the output side for the pooling layer after the backbone
+    for layer in reversed(model.layers):
+        if isinstance(layer, GlobalAveragePooling2D):
+            return layer.output
+    raise ValueError("Model has no GlobalAveragePooling2D layer to attach heads to")
+
+def load_heads(feature_dim: int, heads_dir: str = HEADS_DIR,
+               require_weights: bool = True) -> Dict[str, Model]:
+    """
+    Build every configured head and load its weights independently.
+
+    Heads whose weights file is missing are skipped unless `require_weights`
+    is False, in which case they keep their random initialisation.
+    """
+    heads = {}
+    for name, classes in HEADS.items():
+        head = create_head(name, classes, feature_dim)
+        weights_path = os.path.join(heads_dir, f"{name}.weights.h5")
+        if os.path.exists(weights_path):
+            # A corrupt or incompatible file only disables its own head
+            try:
+                head.load_weights(weights_path)
+            except Exception as e:
+                logger.error(f"Error loading '{name}' head from {weights_path}, skipping it: {str(e)}")
+                continue
+            logger.info(f"Loaded '{name}' head from: {weights_path}")
+        elif require_weights:
+            logger.warning(f"No weights for '{name}' head at {weights_path}, skipping it")
+            continue
+        heads[name] = head
+    return heads
+
+def create_multi_head_model(model: Model, heads: Dict[str, Model]) -> Model:
+    """
+    Combine the classifier and extra heads into one model.
+
+    The backbone runs once per batch; the diagnosis output and every head
+    output are computed from the same pooled features.
+    """
+    features = get_pooled_features(model)
+    outputs = {"diagnosis": model.output}
+    for name, head in heads.items():
+        outputs[name] = head(features)
+    return Model(inputs=model.input, outputs=outputs, name="multi_head_model")
+
+def format_head_outputs(outputs: Dict[str, np.ndarray], index: int = 0) -> Dict[str, Dict]:
+    """Format the extra head outputs of one batch item for the API response."""
+    results = {}
+    for name, probs in outputs.items():
+        if name == "diagnosis":
+            continue
+        classes = HEADS[name]
+        item_probs = probs[index]
+        results[name] = {
+            "predictions": {
+                class_name: float(prob)
+                for class_name, prob in zip(classes, item_probs)
+            },
+            "top_prediction": classes[int(np.argmax(item_probs))],
+            "confidence": float(np.max(item_probs))
+        }
+    return results
+
+def split_outputs(outputs, index: int = 0) -> Tuple[np.ndarray, Dict[str, Dict]]:
+    """Split a model.predict result into diagnosis probabilities and head outputs."""
+    if isinstance(outputs, dict):
+        return outputs["diagnosis"], format_head_outputs(outputs, index)
+    return outputs, {}
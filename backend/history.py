@@ -0,0 +1,277 @@
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+
+from auth import require_user_id
+
+logger = logging.getLogger(__name__)
+
+# Summary columns returned by the history API. The base64 `image_url` column
+# is deliberately left out and only fetched on demand through get_image().
+SUMMARY_COLUMNS = [
+    "id", "created_at", "scan_date", "diagnosis", "diagnosis_date",
+    "confidence", "verified",
+]
+SUMMARY_SELECT = ",".join(SUMMARY_COLUMNS) + ",class_probabilities:metadata->class_probabilities"
+MAX_PAGE_SIZE = 100
+CURSOR_FORBIDDEN_CHARS = '",()\\'
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Encode the (created_at, id) keyset position of a row as an opaque cursor."""
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor(). Raises ValueError if invalid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at, row_id = str(created_at), str(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # The values are embedded in a PostgREST filter, so reject its syntax characters
+    if any(char in value for value in (created_at, row_id) for char in CURSOR_FORBIDDEN_CHARS):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, row_id
+
+def make_etag(payload: Any) -> str:
+    """Compute a weak ETag for a JSON-serialisable payload."""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def build_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Build a history page from up to `limit + 1` rows fetched in keyset order."""
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    for item in items:
+        item["image_path"] = f"/api/history/{item['id']}/image"
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(items[-1]) if has_more and items else None,
+    }
+
+class TTLCache:
+    """Small thread-safe read-through cache with a fixed time-to-live per entry."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop expired entries first, then the oldest ones
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                while len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, prefix):
+        """Remove every entry whose key is a tuple starting with `prefix`."""
+        with self._lock:
+            for key in [k for k in self._entries if isinstance(k, tuple) and k[0] == prefix]:
+                del self._entries[key]
+
+class SupabaseHistoryStore:
+    """Reads prediction history from the Supabase `predictions` table."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def list_predictions(self, user_id: str, limit: int, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return up to `limit` summary rows, newest first, after the cursor position."""
+        query = (
+            self.client.table("predictions")
+            .select(SUMMARY_SELECT)
+            .eq("user_id", user_id)
+            # Equivalent to `order=created_at.desc,id.desc`; id breaks ties between equal timestamps
+            .order("created_at.desc,id", desc=True)
+            .limit(limit)
+        )
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            query = query.or_(
+                f'created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{row_id}")'
+            )
+        return query.execute().data or []
+
+    def get_image(self, user_id: str, prediction_id: str) -> Optional[str]:
+        """Return the stored image data URL of a single prediction, if any."""
+        result = (
+            self.client.table("predictions")
+            .select("image_url")
+            .eq("user_id", user_id)
+            .eq("id", prediction_id)
+            .limit(1)
+            .execute()
+        )
+        if not result.data:
+            return None
+        return result.data[0].get("image_url")
+
+class InMemoryHistoryStore:
+    """
+    Local stand-in for the `predictions` table with the same interface as
+    SupabaseHistoryStore, for development and tests without a database.
+    """
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self.rows: List[Dict[str, Any]] = list(rows or [])
+        self._lock = threading.Lock()
+
+    def insert(self, row: Dict[str, Any]):
+        with self._lock:
+            self.rows.append(dict(row))
+
+    def list_predictions(self, user_id: str, limit: int, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [r for r in self.rows if r.get("user_id") == user_id]
+        rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        if cursor:
+            position = decode_cursor(cursor)
+            rows = [r for r in rows if (r["created_at"], r["id"]) < position]
+
+        summaries = []
+        for row in rows[:limit]:
+            summary = {column: row.get(column) for column in SUMMARY_COLUMNS}
+            summary["class_probabilities"] = (row.get("metadata") or {}).get("class_probabilities")
+            summaries.append(summary)
+        return summaries
+
+    def get_image(self, user_id: str, prediction_id: str) -> Optional[str]:
+        with self._lock:
+            for row in self.rows:
+                if row.get("user_id") == user_id and row.get("id") == prediction_id:
+                    return row.get("image_url")
+        return None
+
+def decode_data_url(data_url: str) -> Tuple[str, bytes]:
+    """Split a base64 data URL into its media type and raw bytes."""
+    header, _, data = data_url.partition(",")
+    if not header.startswith("data:") or ";base64" not in header:
+        raise ValueError("Unsupported image URL format")
+    media_type = header[len("data:"):].split(";")[0] or "application/octet-stream"
+    return media_type, base64.b64decode(data)
+
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+# Set by configure_history(); api.py passes the Supabase store, tests pass
+# an InMemoryHistoryStore
+_history_store = None
+_history_cache = TTLCache(ttl=10)
+
+def configure_history(store, cache: Optional[TTLCache] = None):
+    """Set the store (and optionally the cache) used by the history endpoints."""
+    global _history_store, _history_cache
+    _history_store = store
+    if cache is not None:
+        _history_cache = cache
+
+def invalidate_user_history(user_id: str):
+    """Drop a user's cached history pages, e.g. after saving a new prediction."""
+    _history_cache.invalidate(user_id)
+
+def get_history_store():
+    if _history_store is None:
+        raise HTTPException(status_code=503, detail="Prediction history is not available")
+    return _history_store
+
+@router.get("")
+def prediction_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(require_user_id),
+    store=Depends(get_history_store)
+):
+    """
+    Return a page of the caller's prediction history without the stored images.
+
+    Pages are ordered newest first and paginated with an opaque keyset cursor;
+    pass `next_cursor` from the previous page to continue. Images are fetched
+    separately through each item's `image_path`.
+    """
+    try:
+        page = _history_cache.get_or_load(
+            (user_id, cursor, limit),
+            lambda: build_page(store.list_predictions(user_id, limit + 1, cursor), limit)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error loading prediction history: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to load prediction history")
+
+    etag = make_etag(page)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return page
+
+@router.get("/{prediction_id}/image")
+def prediction_image(
+    prediction_id: str,
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(require_user_id),
+    store=Depends(get_history_store)
+):
+    """Return the stored scan image of one of the caller's predictions."""
+    try:
+        image_url = store.get_image(user_id, prediction_id)
+    except Exception as e:
+        logger.error(f"Error loading image for prediction {prediction_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to load image")
+    if not image_url:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # Checked only after the lookup, so a 304 never confirms another user's prediction.
+    # Stored images never change, so the prediction ID is a stable ETag.
+    etag = f'"{prediction_id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        media_type, content = decode_data_url(image_url)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=content, media_type=media_type, headers=headers)
@@ -0,0 +1,74 @@
+"""
+Local IPC between the gateway (gateway.py) and inference workers (worker.py).
+
+Every message is two frames sent with send_bytes(): a JSON header and a raw
+payload (the image or response body, possibly empty). Nothing is ever
+unpickled, and connections use a Unix domain socket (a named pipe on
+Windows) authenticated with INFERENCE_AUTHKEY, so workers are not reachable
+over the network.
+"""
+import os
+import sys
+import json
+import socket
+import tempfile
+from multiprocessing.connection import Listener, Client
+from typing import Any, Dict, Tuple
+
+FAMILY = 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+MAX_HEADER_BYTES = 1024 * 1024
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024
+
+def get_authkey() -> bytes:
+    """Return the shared IPC key. Raises RuntimeError if it is not configured."""
+    key = os.getenv("INFERENCE_AUTHKEY")
+    if not key:
+        raise RuntimeError("INFERENCE_AUTHKEY must be set to the same secret for the gateway and all workers")
+    return key.encode()
+
+def default_address(name: str = "0") -> str:
+    """Return the default socket path (or pipe name on Windows) of a worker."""
+    if FAMILY == 'AF_PIPE':
+        return rf"\\.\pipe\ophthalmoscan-worker-{name}"
+    return os.path.join(tempfile.gettempdir(), f"ophthalmoscan-worker-{name}.sock")
+
+def address_in_use(address: str) -> bool:
+    """Check whether a Unix socket path is still accepting connections."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(address)
+        except OSError:
+            return False
+    return True
+
+def listen(address: str, authkey: bytes) -> Listener:
+    """
+    Listen on a local address, replacing a socket file left by a previous run.
+
+    Raises RuntimeError if another process is still listening on it. (On
+    Windows, creating a second listener on a pipe name fails by itself.)
+    """
+    if FAMILY == 'AF_UNIX' and os.path.exists(address):
+        if address_in_use(address):
+            raise RuntimeError(f"{address} is already in use by another worker")
+        os.remove(address)
+    listener = Listener(address, family=FAMILY, authkey=authkey)
+    if FAMILY == 'AF_UNIX':
+        # Only the owning user may connect
+        os.chmod(address, 0o600)
+    return listener
+
+def connect(address: str, authkey: bytes):
+    return Client(address, family=FAMILY, authkey=authkey)
+
+def send_message(conn, header: Dict[str, Any], payload: bytes = b""):
+    conn.send_bytes(json.dumps(header).encode())
+    conn.send_bytes(payload)
+
+def recv_message(conn) -> Tuple[Dict[str, Any], bytes]:
+    """Receive a (header, payload) pair. Raises ValueError on a malformed header."""
+    header = json.loads(conn.recv_bytes(MAX_HEADER_BYTES))
+    if not isinstance(header, dict):
+        raise ValueError("Message header must be a JSON object")
+    payload = conn.recv_bytes(MAX_PAYLOAD_BYTES)
+    return header, payload
@@ -0,0 +1,54 @@
+"""
+Measure import time and resident memory of the gateway and inference worker.
+
+Each process type is started in a fresh interpreter so module caches don't
+skew the results. The worker measurement includes loading the model and the
+warm-up prediction, i.e. the time until it reports ready.
+
+Usage: python measure_processes.py
+"""
+import os
+import sys
+import json
+import subprocess
+
+PROBE = r'''
+import json, time
+start = time.perf_counter()
+{setup}
+elapsed = time.perf_counter() - start
+# Imported after timing; works on Linux, macOS and Windows
+from profiling import read_rss_bytes
+print(json.dumps({{"seconds": elapsed, "rss_bytes": read_rss_bytes()}}))
+'''
+
+PROCESSES = {
+    "gateway": "import gateway",
+    "worker": "import worker\nw = worker.InferenceWorker(None)\nw.load()\nassert w.state == 'ready', w.error",
+}
+
+def measure(setup):
+    """Run the probe in a fresh interpreter and return its JSON result."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(setup=setup)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    print(f"{'process':<10} {'startup (s)':>12} {'RSS (MiB)':>10}")
+    for name, setup in PROCESSES.items():
+        try:
+            stats = measure(setup)
+        except Exception as e:
+            print(f"{name:<10} failed: {str(e)}")
+            continue
+        rss = f"{stats['rss_bytes'] / 2**20:.1f}" if stats['rss_bytes'] is not None else "n/a"
+        print(f"{name:<10} {stats['seconds']:>12.2f} {rss:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import json
+import hmac
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACTS_DIR = os.path.join(os.path.dirname(__file__), 'profiling_artifacts')
+SAMPLE_INTERVAL = 0.005
+MAX_DURATION = 120
+# (file, function) of the top frame of a thread blocked waiting for work, e.g. the
+# event loop in select() or a pool thread waiting on its queue; not CPU time
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv"),
+    ("connection.py", "accept"),
+    ("socket.py", "accept"),
+}
+
+router = APIRouter(prefix="/admin/profiling", tags=["profiling"])
+
+def require_admin(token: Optional[str]):
+    """Reject requests unless profiling is enabled and the admin token matches."""
+    # Read at request time so a token set in .env (loaded after import) is used
+    admin_token = os.getenv("PROFILING_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def artifact_path(kind: str, extension: str = "") -> str:
+    """
+    Return a new path in the artifacts directory.
+
+    Names include microseconds and the process ID, so artifacts written in
+    the same second or by several workers sharing the directory never clash.
+    """
+    artifacts_dir = os.getenv("PROFILING_ARTIFACTS_DIR", DEFAULT_ARTIFACTS_DIR)
+    os.makedirs(artifacts_dir, exist_ok=True)
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S.%f")
+    return os.path.join(artifacts_dir, f"{kind}-{timestamp}-{os.getpid()}{extension}")
+
+def is_idle(frame) -> bool:
+    """Check whether a thread's top frame is a known wait for work."""
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+class SamplingProfiler:
+    """
+    Sampling profiler for the busy Python threads in the process.
+
+    A daemon thread periodically snapshots all thread stacks and counts
+    collapsed stacks, written in the format read by flamegraph.pl and
+    speedscope. Threads idling in a known wait (IDLE_FRAMES) are skipped;
+    the rest are sampled on wall-clock time, so a thread blocked elsewhere
+    (I/O, a native TensorFlow call) still counts. Nothing runs while no
+    session is active.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float) -> str:
+        """Start a session of `duration` seconds and return its output path."""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A CPU profiling session is already running")
+            output_path = artifact_path("cpu", ".collapsed")
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration, output_path),
+                name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return output_path
+
+    def stop(self):
+        """Stop the running session early; its samples are still written."""
+        self._stop.set()
+
+    def _run(self, duration: float, output_path: str):
+        own_id = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            self._stop.wait(self.interval)
+
+        with open(output_path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"CPU profile with {samples} samples written to {output_path}")
+
+class TensorFlowTracer:
+    """Captures a TensorFlow profiler trace of everything the model runs in a time window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def running(self) -> bool:
+        return self._timer is not None and self._timer.is_alive()
+
+    def start(self, duration: float) -> str:
+        # TensorFlow is imported lazily so this module stays usable without it
+        import tensorflow as tf
+
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A TensorFlow trace is already running")
+            logdir = artifact_path("tf-trace")
+            tf.profiler.experimental.start(logdir)
+            self._timer = threading.Timer(duration, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            return logdir
+
+    def stop(self):
+        import tensorflow as tf
+
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            try:
+                tf.profiler.experimental.stop()
+                logger.info("TensorFlow trace written")
+            except Exception as e:
+                logger.error(f"Error stopping TensorFlow trace: {str(e)}")
+
+def _read_windows_working_set() -> Optional[int]:
+    """Return the working set size of this process on Windows."""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.WinDLL("psapi")
+    if psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return counters.WorkingSetSize
+    return None
+
+def read_rss_bytes() -> Optional[int]:
+    """Return the current resident set size of this process, if available."""
+    if sys.platform == "win32":
+        try:
+            return _read_windows_working_set()
+        except (OSError, AttributeError):
+            return None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak RSS, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+def tensorflow_memory() -> Dict[str, Any]:
+    """Return TensorFlow allocator usage per device, if TensorFlow is loaded."""
+    tf = sys.modules.get("tensorflow")
+    if tf is None:
+        return {}
+    usage = {}
+    for device in tf.config.list_logical_devices():
+        try:
+            usage[device.name] = tf.config.experimental.get_memory_info(device.name)
+        except (ValueError, tf.errors.OpError):
+            # The CPU allocator does not expose memory statistics
+            continue
+    return usage
+
+sampling_profiler = SamplingProfiler()
+tensorflow_tracer = TensorFlowTracer()
+
+@router.post("/cpu/start")
+def start_cpu_profile(
+    seconds: float = Query(10, gt=0, le=MAX_DURATION),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Start sampling busy Python threads for `seconds` seconds.
+
+    Idle threads (the event loop, pool threads waiting for work) are left
+    out; other threads are sampled on wall-clock time, including while
+    blocked in I/O or native code.
+    """
+    require_admin(x_admin_token)
+    try:
+        output_path = sampling_profiler.start(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "started", "seconds": seconds, "artifact": output_path}
+
+@router.post("/cpu/stop")
+def stop_cpu_profile(x_admin_token: Optional[str] = Header(None)):
+    """Stop the running CPU profiling session early."""
+    require_admin(x_admin_token)
+    sampling_profiler.stop()
+    return {"status": "stopping"}
+
+@router.post("/tf-trace/start")
+def start_tf_trace(
+    seconds: float = Query(10, gt=0, le=MAX_DURATION),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Capture a TensorFlow profiler trace of every model.predict in the next `seconds` seconds."""
+    require_admin(x_admin_token)
+    try:
+        logdir = tensorflow_tracer.start(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error starting TensorFlow trace: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to start trace: {str(e)}")
+    return {"status": "started", "seconds": seconds, "artifact": logdir}
+
+@router.post("/tf-trace/stop")
+def stop_tf_trace(x_admin_token: Optional[str] = Header(None)):
+    """Stop the running TensorFlow trace early."""
+    require_admin(x_admin_token)
+    tensorflow_tracer.stop()
+    return {"status": "stopped"}
+
+@router.post("/memory")
+def memory_snapshot(
+    top: int = Query(25, ge=1, le=200),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Report RSS and TensorFlow memory usage and, if tracemalloc is tracing,
+    write a snapshot of the top allocation sites.
+    """
+    require_admin(x_admin_token)
+    report = {
+        "rss_bytes": read_rss_bytes(),
+        "tensorflow": tensorflow_memory(),
+        "tracemalloc": None,
+    }
+
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ],
+        }
+        output_path = artifact_path("tracemalloc", ".snapshot")
+        snapshot.dump(output_path)
+        report["artifact"] = output_path
+
+    output_path = artifact_path("memory", ".json")
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    report["report"] = output_path
+    return report
+
+@router.post("/tracemalloc/{action}")
+def toggle_tracemalloc(action: str, x_admin_token: Optional[str] = Header(None)):
+    """Start or stop tracemalloc; it slows allocations down while tracing."""
+    require_admin(x_admin_token)
+    if action == "start":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+    elif action == "stop":
+        tracemalloc.stop()
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown action: {action}")
+    return {"tracing": tracemalloc.is_tracing()}
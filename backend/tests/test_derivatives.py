@@ -0,0 +1,23 @@
+import io
+
+from PIL import Image
+
+from derivatives import DerivativeCache
+
+def make_jpeg(size=(2048, 1536)):
+    with io.BytesIO() as buffer:
+        Image.new('RGB', size, (120, 30, 10)).save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+def test_derivatives_are_only_returned_to_uploaders():
+    cache = DerivativeCache()
+    content = make_jpeg()
+    digest = cache.add(content, owner="user_1")
+
+    derivatives = cache.get(digest, owner="user_1")
+    assert max(Image.open(io.BytesIO(derivatives["preview"].content)).size) == 1024
+    assert cache.get(digest, owner="user_2") is None
+
+    # Another user uploading the same image gains access to it
+    cache.add(content, owner="user_2")
+    assert cache.get(digest, owner="user_2") is not None
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from benchmark_heads import create_classifier
+from heads import HEADS, create_head, get_pooled_features, create_multi_head_model
+
+def test_heads_attach_to_pooled_backbone_features():
+    classifier = create_classifier()
+
+    # Not one of the squeeze-and-excitation poolings inside EfficientNet's blocks
+    features = get_pooled_features(classifier)
+    assert features.shape[-1] == 1536
+
+    heads = {name: create_head(name, classes, features.shape[-1]) for name, classes in HEADS.items()}
+    model = create_multi_head_model(classifier, heads)
+    assert set(model.output) == {"diagnosis", *HEADS}
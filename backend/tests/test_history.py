@@ -0,0 +1,151 @@
+import hmac
+import json
+import base64
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import history
+from history import InMemoryHistoryStore, TTLCache, configure_history, invalidate_user_history
+
+JWT_SECRET = "test-secret"
+
+def make_token(user_id, secret=JWT_SECRET):
+    """Sign an HS256 token like Clerk's `supabase` JWT template."""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    signing_input = f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode({'sub': user_id})}"
+    signature = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{base64.urlsafe_b64encode(signature).decode().rstrip('=')}"
+
+def auth(user_id="user_1"):
+    return {"Authorization": f"Bearer {make_token(user_id)}"}
+
+def make_row(row_id, created_at, user_id="user_1", diagnosis="normal"):
+    return {
+        "id": row_id,
+        "user_id": user_id,
+        "created_at": created_at,
+        "diagnosis": diagnosis,
+        "confidence": 0.9,
+        "metadata": {"class_probabilities": {diagnosis: 0.9}},
+        "image_url": "data:image/jpeg;base64," + base64.b64encode(f"image-{row_id}".encode()).decode(),
+    }
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(history.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture
+def store(monkeypatch, clock):
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", JWT_SECRET)
+    store = InMemoryHistoryStore()
+    configure_history(store, TTLCache(ttl=10))
+    yield store
+    configure_history(None, TTLCache(ttl=10))
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    app.include_router(history.router)
+    return TestClient(app)
+
+def test_keyset_pagination_with_equal_timestamps(store, client):
+    # Five rows share a timestamp, so only the id orders them
+    for i in range(5):
+        store.insert(make_row(f"id-{i}", "2024-01-02T00:00:00"))
+    store.insert(make_row("id-9", "2024-01-01T00:00:00"))
+    store.insert(make_row("other", "2024-01-03T00:00:00", user_id="user_2"))
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/history", params=params, headers=auth())
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == ["id-4", "id-3", "id-2", "id-1", "id-0", "id-9"]
+
+def test_items_are_summaries_without_image_data(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00"))
+    item = client.get("/api/history", headers=auth()).json()["items"][0]
+    assert "image_url" not in item
+    assert item["class_probabilities"] == {"normal": 0.9}
+    assert item["image_path"] == "/api/history/id-1/image"
+
+def test_requires_valid_token(store, client):
+    assert client.get("/api/history").status_code == 401
+    forged = {"Authorization": f"Bearer {make_token('user_1', secret='wrong')}"}
+    assert client.get("/api/history", headers=forged).status_code == 401
+
+def test_invalid_cursor_returns_400(store, client):
+    response = client.get("/api/history", params={"cursor": "not-a-cursor"}, headers=auth())
+    assert response.status_code == 400
+
+def test_etag_match_returns_304(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00"))
+    response = client.get("/api/history", headers=auth())
+    etag = response.headers["ETag"]
+
+    response = client.get("/api/history", headers={**auth(), "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+def test_cache_expires_after_ttl(store, client, clock):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00"))
+    assert len(client.get("/api/history", headers=auth()).json()["items"]) == 1
+
+    # Rows written directly to the store stay hidden until the page expires
+    store.insert(make_row("id-2", "2024-01-02T00:00:00"))
+    assert len(client.get("/api/history", headers=auth()).json()["items"]) == 1
+
+    clock.now += 11
+    assert len(client.get("/api/history", headers=auth()).json()["items"]) == 2
+
+def test_cache_invalidated_after_save(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00"))
+    client.get("/api/history", headers=auth())
+
+    store.insert(make_row("id-2", "2024-01-02T00:00:00"))
+    invalidate_user_history("user_1")
+    items = client.get("/api/history", headers=auth()).json()["items"]
+    assert [item["id"] for item in items] == ["id-2", "id-1"]
+
+def test_image_is_served_lazily(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00"))
+
+    response = client.get("/api/history/id-1/image", headers=auth())
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content == b"image-id-1"
+
+    cached = client.get("/api/history/id-1/image", headers={**auth(), "If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
+def test_image_of_another_user_is_not_found(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00", user_id="user_2"))
+    assert client.get("/api/history/id-1/image", headers=auth()).status_code == 404
+
+def test_etag_does_not_bypass_ownership_check(store, client):
+    store.insert(make_row("id-1", "2024-01-01T00:00:00", user_id="user_2"))
+    response = client.get("/api/history/id-1/image", headers={**auth(), "If-None-Match": '"id-1"'})
+    assert response.status_code == 404
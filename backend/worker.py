@@ -0,0 +1,207 @@
+"""
+Inference worker for the lightweight gateway in gateway.py.
+
+Listens on a local socket before loading anything heavy, so the gateway can
+see its warm-up state, then imports api.py (TensorFlow, model weights,
+Supabase), runs a warm-up prediction and starts accepting requests. Besides
+predictions, the gateway forwards the other api.py routes (history, image
+derivatives, profiling) here as plain HTTP requests.
+
+Usage: INFERENCE_AUTHKEY=... python worker.py [--socket PATH]
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from ipc import get_authkey, default_address, listen, send_message, recv_message
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load INFERENCE_AUTHKEY and the rest of the environment from .env before it is read
+load_dotenv()
+
+def call_asgi(app, method: str, path: str, query_string: str,
+              headers: List[List[str]], body: bytes) -> Tuple[int, List[List[str]], bytes]:
+    """Run one HTTP request through an ASGI app in-process and return (status, headers, body)."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    request_sent = False
+    response = {"status": 500, "headers": [], "body": bytearray()}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = [
+                [name.decode("latin-1"), value.decode("latin-1")] for name, value in message.get("headers", [])
+            ]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    asyncio.run(app(scope, receive, send))
+    return response["status"], response["headers"], bytes(response["body"])
+
+class InferenceWorker:
+    """Serves gateway requests over local IPC connections."""
+
+    def __init__(self, address):
+        self.address = address
+        self.state = "starting"
+        self.error = None
+        self.api = None
+        self.started_at = time.time()
+        self.ready_at = None
+        # Previews are attached after the reply is sent, like FastAPI background tasks
+        self.storage_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.state == "ready",
+            "error": self.error,
+            "pid": os.getpid(),
+            "warmup_seconds": self.ready_at - self.started_at if self.ready_at else None,
+            "modelType": "EfficientNetB3",
+            "heads": self.api.head_names if self.api else [],
+        }
+
+    def load(self):
+        """Import the API module (which loads the model) and run a warm-up prediction."""
+        try:
+            self.state = "loading"
+            import api
+            if api.model is None:
+                raise RuntimeError("Model not loaded")
+
+            # The first predict call traces the graph; do it before reporting ready
+            self.state = "warming_up"
+            from PIL import Image
+            with io.BytesIO() as buffer:
+                Image.new('RGB', (api.IMG_SIZE, api.IMG_SIZE)).save(buffer, format='PNG')
+                api.run_prediction(buffer.getvalue())
+
+            self.api = api
+            self.ready_at = time.time()
+            self.state = "ready"
+            logger.info(f"Worker ready after {self.ready_at - self.started_at:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.error(f"Worker failed to load model: {str(e)}")
+
+    def predict(self, header: Dict[str, Any], content: bytes) -> Dict[str, Any]:
+        try:
+            results = self.api.run_prediction(content)
+            if self.api.prepare_storage(results, content, header["user_id"]):
+                self.storage_executor.submit(
+                    self.api.store_preview, results["prediction_id"], content, results["image_id"]
+                )
+            return {"status": 200, "body": results}
+        except Exception as e:
+            logger.error(f"Prediction error: {str(e)}")
+            return {"status": 500, "detail": f"Failed to analyze image: {str(e)}"}
+
+    def forward_http(self, header: Dict[str, Any], body: bytes) -> Tuple[Dict[str, Any], bytes]:
+        """Serve a request forwarded by the gateway with the api.py app."""
+        try:
+            status, headers, content = call_asgi(
+                self.api.app, header["method"], header["path"],
+                header.get("query", ""), header.get("headers", []), body
+            )
+            return {"status": status, "headers": headers}, content
+        except Exception as e:
+            logger.error(f"Error serving forwarded request {header.get('path')}: {str(e)}")
+            return {"status": 500, "detail": "Worker failed to handle the request"}, b""
+
+    def handle(self, header: Dict[str, Any], payload: bytes) -> Tuple[Dict[str, Any], bytes]:
+        op = header.get("op")
+        if op == "status":
+            return self.status(), b""
+        if op not in ("predict", "http"):
+            return {"status": 400, "detail": f"Unknown operation: {op}"}, b""
+        if self.state != "ready":
+            return {"status": 503, "detail": f"Worker not ready ({self.state})"}, b""
+        if op == "predict":
+            return self.predict(header, payload), b""
+        return self.forward_http(header, payload)
+
+    def serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    header, payload = recv_message(conn)
+                except (EOFError, OSError, ValueError):
+                    return
+                reply, reply_payload = self.handle(header, payload)
+                try:
+                    send_message(conn, reply, reply_payload)
+                except OSError:
+                    # The gateway closed the connection, e.g. after a timeout
+                    return
+
+    def serve(self, listener):
+        """Accept gateway connections, one thread per connection."""
+        with listener:
+            logger.info(f"Inference worker listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed authentication or a dropped handshake
+                    logger.warning(f"Rejected connection: {str(e)}")
+                    continue
+                threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="OphthalmoScan AI inference worker")
+    parser.add_argument('--socket', default=default_address(),
+                        help="Unix socket path (named pipe on Windows) to listen on")
+    args = parser.parse_args()
+
+    try:
+        authkey = get_authkey()
+        listener = listen(args.socket, authkey)
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    worker = InferenceWorker(args.socket)
+    threading.Thread(target=worker.serve, args=(listener,), daemon=True).start()
+    worker.load()
+
+    # Keep serving status requests even if loading failed
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
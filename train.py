@@ -0,0 +1,204 @@
+import os
+import glob
+import time
+import hashlib
+import argparse
+import tensorflow as tf
+
+from create_model import create_model, IMG_SIZE, CLASSES, MODEL_PATH
+
+AUTOTUNE = tf.data.AUTOTUNE
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+CHECKPOINT_DIR = 'checkpoints/train'
+CACHE_DIR = 'cache/train'
+
+def list_image_files(data_dir):
+    """List labelled image files from a `<data_dir>/<class_name>/<image>` layout."""
+    paths, labels = [], []
+    for class_idx, class_name in enumerate(CLASSES):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            print(f"Warning: no directory for class '{class_name}' in {data_dir}")
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(class_dir, filename))
+                labels.append(class_idx)
+
+    if not paths:
+        raise FileNotFoundError(f"No labelled images found in {data_dir}")
+    return paths, labels
+
+def decode_image(path, label):
+    """Read, decode and resize a single image file to the model input size."""
+    content = tf.io.read_file(path)
+    image = tf.io.decode_image(content, channels=3, expand_animations=False)
+    # Bicubic with antialiasing, matching the PIL resize used by preprocess_image() when serving
+    image = tf.image.resize(image, (IMG_SIZE, IMG_SIZE), method='bicubic', antialias=True)
+    image.set_shape((IMG_SIZE, IMG_SIZE, 3))
+    return image, tf.one_hot(label, len(CLASSES))
+
+def augment_batch(images, labels):
+    """Apply random augmentation to a whole batch at once."""
+    batch_size = tf.shape(images)[0]
+
+    # Per-image random horizontal flip, selected with a single vectorized mask
+    flip = tf.random.uniform((batch_size, 1, 1, 1)) < 0.5
+    images = tf.where(flip, tf.image.flip_left_right(images), images)
+
+    # Per-image brightness and contrast jitter (pixel values are in [0, 255])
+    brightness = tf.random.uniform((batch_size, 1, 1, 1), -0.1, 0.1) * 255.0
+    contrast = tf.random.uniform((batch_size, 1, 1, 1), 0.9, 1.1)
+    mean = tf.reduce_mean(images, axis=[1, 2, 3], keepdims=True)
+    images = (images - mean) * contrast + mean + brightness
+    images = tf.clip_by_value(images, 0.0, 255.0)
+
+    return images, labels
+
+def cache_path_for(data_dir, paths, prefix):
+    """
+    Return the on-disk cache path for an image set.
+
+    The name is keyed on the directory and the name, size and modification
+    time of every file, so a different or changed dataset (including an image
+    replaced under the same name) never reuses tensors cached for another one.
+    """
+    key = hashlib.sha1()
+    key.update(os.path.abspath(data_dir).encode())
+    key.update(str(IMG_SIZE).encode())
+    for path in paths:
+        stat = os.stat(path)
+        key.update(f"\0{path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode())
+    return os.path.join(CACHE_DIR, f"{prefix}-{key.hexdigest()[:16]}")
+
+def remove_stale_cache_locks(cache_path):
+    """
+    Remove lockfiles left behind by a run killed while writing the cache.
+
+    Without this, resuming after an interrupted first epoch fails with
+    AlreadyExistsError. Only one process may use a cache prefix at a time, so
+    the benchmark uses its own prefix and never touches a training run's locks.
+    """
+    for lockfile in glob.glob(f"{cache_path}*.lockfile"):
+        print(f"Removing stale cache lockfile: {lockfile}")
+        os.remove(lockfile)
+
+def build_dataset(data_dir, batch_size, cache_prefix=None, training=True):
+    """
+    Build a streaming input pipeline for a labelled image directory.
+
+    With a `cache_prefix`, decoded and resized images are cached on disk after
+    the first full epoch so later epochs skip file decoding entirely.
+    """
+    paths, labels = list_image_files(data_dir)
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+
+    if training:
+        # Shuffle file names once up front so the first epoch is not ordered by class
+        dataset = dataset.shuffle(len(paths), seed=42, reshuffle_each_iteration=False)
+
+    dataset = dataset.map(decode_image, num_parallel_calls=AUTOTUNE, deterministic=not training)
+
+    if cache_prefix:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        cache_path = cache_path_for(data_dir, paths, cache_prefix)
+        remove_stale_cache_locks(cache_path)
+        dataset = dataset.cache(cache_path)
+
+    if training:
+        dataset = dataset.shuffle(min(len(paths), 1000), reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size, drop_remainder=training)
+
+    if training:
+        dataset = dataset.map(augment_batch, num_parallel_calls=AUTOTUNE)
+
+    return dataset.prefetch(AUTOTUNE)
+
+def time_batches(dataset, num_batches=None):
+    """Iterate over `num_batches` batches (or the whole dataset) and return (images, seconds)."""
+    if num_batches is not None:
+        dataset = dataset.take(num_batches)
+    start = time.perf_counter()
+    images = 0
+    for batch_images, _ in dataset:
+        images += int(batch_images.shape[0])
+    return images, time.perf_counter() - start
+
+def benchmark_dataset(data_dir, batch_size, num_batches, use_cache=True):
+    """Measure how many images per second the input pipeline can deliver."""
+    def report(label, images, elapsed):
+        print(f"Input pipeline ({label}): {images} images in {elapsed:.2f}s "
+              f"({images / elapsed:.1f} images/s)")
+
+    # Cold: every image is read and decoded from its file
+    uncached = build_dataset(data_dir, batch_size, cache_prefix=None, training=True)
+    report('cold, uncached', *time_batches(uncached, num_batches))
+
+    if not use_cache:
+        return
+
+    # tf.data discards a partially written cache, so the cache has to be
+    # filled by a complete pass before a warm pass can be measured
+    cached = build_dataset(data_dir, batch_size, cache_prefix='benchmark', training=True)
+    report('full pass, filling cache', *time_batches(cached))
+    report('warm, cached', *time_batches(cached, num_batches))
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the eye disease classifier")
+    parser.add_argument('--train-dir', required=True, help="Directory with one sub-directory per class")
+    parser.add_argument('--val-dir', help="Optional validation directory with the same layout")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default=MODEL_PATH, help="Where to save the final weights")
+    parser.add_argument('--no-cache', action='store_true', help="Disable on-disk caching of decoded images")
+    parser.add_argument('--benchmark', type=int, metavar='BATCHES',
+                        help="Only benchmark the input pipeline over this many batches")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_dataset(args.train_dir, args.batch_size, args.benchmark, use_cache=not args.no_cache)
+        return
+
+    train_ds = build_dataset(
+        args.train_dir, args.batch_size,
+        cache_prefix=None if args.no_cache else 'train', training=True
+    )
+
+    val_ds = None
+    if args.val_dir:
+        val_ds = build_dataset(
+            args.val_dir, args.batch_size,
+            cache_prefix=None if args.no_cache else 'val', training=False
+        )
+
+    model = create_model()
+
+    # BackupAndRestore saves the training state at the end of every epoch and
+    # resumes from it automatically when the script is restarted
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    callbacks = [
+        tf.keras.callbacks.BackupAndRestore(backup_dir=CHECKPOINT_DIR),
+        tf.keras.callbacks.ModelCheckpoint(
+            os.path.join(CHECKPOINT_DIR, 'best.weights.h5'),
+            monitor='val_loss' if val_ds is not None else 'loss',
+            save_best_only=True,
+            save_weights_only=True
+        ),
+    ]
+
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=callbacks,
+        verbose=1
+    )
+
+    # Save the weights in the HDF5 format expected by load_model() in backend/api.py
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    model.save_weights(args.output)
+    print(f"Model saved to {args.output}")
+
+if __name__ == '__main__':
+    main()